@@ -1,8 +1,129 @@
 """Functions for building a JSON dependency tree with package sizes."""
 
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from importlib import metadata
+import functools
 import json
-import subprocess
+import os
+import threading
+
+from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name
+
+# ijson allows streaming one entry of a legacy cache file at a time instead of
+# materializing the whole file; fall back to json when it isn't installed
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# orjson's C serializer is several times faster than the stdlib json module;
+# fall back to json when it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj):
+    """Serialize an object to compact JSON bytes for a cache file."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _loads(data):
+    """Deserialize JSON bytes read from a cache file."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Persistent package size cache, stored next to the dependencies cache file.
+# Maps "name==version" to {"size": ..., "mtime": ...} where mtime is the
+# modification time of the install location when the size was collected.
+SIZE_CACHE_FILE = "_size_cache.json"
+
+_size_cache = None
+_size_cache_lock = threading.Lock()
+
+
+def _installed_distributions():
+    """
+    Build a mapping of installed packages to their distributions.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping canonical package names to their
+        ``importlib.metadata.Distribution`` objects.
+    """
+    return {
+        canonicalize_name(dist.metadata["Name"]): dist
+        for dist in metadata.distributions()
+    }
+
+
+def _requirement_keys(dist):
+    """
+    Get the canonical names of a distribution's direct dependencies.
+
+    Parameters
+    ----------
+    dist : importlib.metadata.Distribution
+        The distribution to read requirements from.
+
+    Returns
+    -------
+    list
+        The canonical names of the distribution's required packages,
+        excluding requirements whose environment markers do not apply (e.g.
+        extras that were not requested).
+    """
+    keys = []
+    for requirement in dist.requires or []:
+        requirement = Requirement(requirement)
+        if requirement.marker and not requirement.marker.evaluate({"extra": ""}):
+            continue
+        keys.append(canonicalize_name(requirement.name))
+    return keys
+
+
+def _build_deptree(key, distributions, _ancestors=frozenset()):
+    """
+    Build the dependency tree node for a single package.
+
+    Parameters
+    ----------
+    key : str
+        The canonical name of the package.
+    distributions : dict
+        A mapping of canonical package names to their distributions as
+        returned by `_installed_distributions`.
+    _ancestors : frozenset, optional
+        The canonical names of packages higher up in the current branch. Used
+        to break dependency cycles.
+
+    Returns
+    -------
+    dict
+        A dictionary with the keys "key", "package_name", "installed_version",
+        and "dependencies", where "dependencies" is a list of nodes of the
+        same shape.
+    """
+    dist = distributions[key]
+    ancestors = _ancestors | {key}
+    dependencies = [
+        _build_deptree(dep_key, distributions, _ancestors=ancestors)
+        for dep_key in _requirement_keys(dist)
+        if dep_key in distributions and dep_key not in ancestors
+    ]
+    return {
+        "key": key,
+        "package_name": dist.metadata["Name"],
+        "installed_version": dist.version,
+        "dependencies": dependencies,
+    }
 
 
 def get_deptree(package_name):
@@ -16,17 +137,23 @@ def get_deptree(package_name):
 
     Returns
     -------
-    dict
-        The dependency tree in JSON format.
-    """
-    # Use pip show command to get package information
-    result = subprocess.run(
-        ["pipdeptree", "--json-tree", "-p", package_name],
-        capture_output=True,
-        text=True,
-    )
-    deptree = json.loads(result.stdout)
-    return deptree
+    list
+        The dependency tree in JSON format. A single-element list containing
+        the root package's node, where each node has the keys "key",
+        "package_name", "installed_version", and "dependencies".
+
+    Raises
+    ------
+    ValueError
+        If the package is not installed.
+    """
+    # Resolve all installed distributions once and reuse the mapping for the
+    # whole tree
+    distributions = _installed_distributions()
+    key = canonicalize_name(package_name)
+    if key not in distributions:
+        raise ValueError(f"Package not found: {package_name}")
+    return [_build_deptree(key, distributions)]
 
 
 def case_insensitive_startswith_search(directory, pattern):
@@ -45,44 +172,46 @@ def case_insensitive_startswith_search(directory, pattern):
     list
         A list of file paths that match the given pattern, ignoring case.
     """
-    return [
-        str(path)
-        for path in Path(directory).glob("*")
-        if path.name.lower().startswith(pattern.lower())
-    ]
+    pattern = pattern.lower()
+    with os.scandir(directory) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.name[: len(pattern)].lower() == pattern
+        ]
 
 
-def kbytes_to_human_readable(num_kbytes):
+def format_size(num_bytes):
     """
-    Convert a number in kilobytes to a human-readable format.
+    Convert a number of bytes to a human-readable size string.
 
     Parameters
     ----------
-    num_kbytes : int or float
-        The number of kilobytes to convert.
+    num_bytes : int or float
+        The number of bytes to convert.
 
     Returns
     -------
     str
-        The human-readable format of the input number, with the appropriate unit (KB,
-        MB, GB, etc.).
+        The human-readable format of the input number, with the appropriate unit (B,
+        KB, MB, etc.).
 
     Examples
     --------
-    >>> kbytes_to_human_readable(2048)
+    >>> format_size(2 * 1024 * 1024)
     '2MB'
 
-    >>> kbytes_to_human_readable(1024)
-    '1MB'
+    >>> format_size(1024)
+    '1KB'
 
-    >>> kbytes_to_human_readable(512)
-    '512KB'
+    >>> format_size(512)
+    '512B'
     """
-    for unit in ["KB", "MB", "GB", "TB", "PB", "EB", "ZB"]:
-        if abs(num_kbytes) < 1024.0:
-            return f"{int(num_kbytes)}{unit}"
-        num_kbytes /= 1024.0
-    return f"{num_kbytes:3d} YB"
+    for unit in ["B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB"]:
+        if abs(num_bytes) < 1024.0:
+            return f"{int(num_bytes)}{unit}"
+        num_bytes /= 1024.0
+    return f"{int(num_bytes)}YB"
 
 
 def get_package_location(package_name):
@@ -104,25 +233,70 @@ def get_package_location(package_name):
     ValueError
         If the package's location is not found.
     """
-    # Use pip show command to get package information
-    result = subprocess.run(
-        ["pip", "show", package_name], capture_output=True, text=True
-    )
-    output = result.stdout
+    # Read the package's metadata to find the directory it was installed into
+    try:
+        dist = metadata.distribution(package_name)
+    except metadata.PackageNotFoundError:
+        raise ValueError(f"Location not found for package: {package_name}")
+    return str(dist.locate_file(""))
+
 
-    # Parse the output to get the package location
-    for line in output.splitlines():
-        if line.startswith("Location:"):
-            location = line.split(":")[1].strip()
-            return location
+def _dir_size(path):
+    """
+    Get the total size of a directory and its contents in bytes.
 
-    # Raise a ValueError if the package's location isn't found
-    raise ValueError(f"Location not found for package: {package_name}")
+    The walk uses the file types reported by the directory listing itself and
+    never follows symlinks, so each regular file costs at most one stat call
+    and directories and symlinks cost none.
+
+    Parameters
+    ----------
+    path : str
+        The path to the directory.
+
+    Returns
+    -------
+    int
+        The total size of all files in the directory tree in bytes.
+    """
+    total = 0
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def _load_size_cache():
+    """
+    Load the persistent package size cache from disk.
+
+    Returns
+    -------
+    dict
+        The cached size entries, or an empty dictionary if the cache file is
+        missing or unreadable.
+    """
+    try:
+        with open(SIZE_CACHE_FILE, "rb") as file:
+            return _loads(file.read())
+    except (FileNotFoundError, ValueError):
+        return {}
 
 
+@functools.lru_cache(maxsize=None)
 def get_package_size(package_name):
     """
-    Get the size of a package in human readable format.
+    Get the size of a package in bytes.
+
+    Sizes are memoized per package name, so repeated requests for the same
+    package do not walk its directories again. Sizes are also cached on disk
+    keyed by package version, so later runs in the same environment skip the
+    walk entirely unless the install location has changed.
 
     Parameters
     ----------
@@ -131,89 +305,317 @@ def get_package_size(package_name):
 
     Returns
     -------
-    str
-        The size of the package in human-readable format.
+    int
+        The size of the package in bytes. Use `format_size` to produce a
+        display string.
 
     """
+    global _size_cache
+
     # Get the location of the package
     location = get_package_location(package_name)
 
-    # Use the du command to get the size of the directory and its contents
+    # Return the persistently cached size if the install location hasn't
+    # changed since it was collected
+    cache_key = f"{package_name}=={metadata.version(package_name)}"
+    mtime = os.stat(location).st_mtime
+    with _size_cache_lock:
+        if _size_cache is None:
+            _size_cache = _load_size_cache()
+        entry = _size_cache.get(cache_key)
+        if (
+            entry
+            and entry.get("mtime") == mtime
+            and isinstance(entry.get("size"), int)
+        ):
+            return entry["size"]
+
+    # Walk the package's directories in-process to get their total size
     package_dirs = case_insensitive_startswith_search(location, package_name)
-    sizes = []
+    num_bytes = 0
     for package_dir in package_dirs:
-        result = subprocess.run(
-            ["du", "-s", package_dir], capture_output=True, text=True
-        )
-        output = result.stdout
-        # Parse the output to get the size
-        sizes.append(int(output.split()[0]))
-    size = kbytes_to_human_readable(sum(sizes))
-    return size
-
-
-def add_package_sizes(
-    packages, _package_sizes={}, _pkg_ind=0, _cur_depth=-1, _is_root=True
-):
+        if os.path.isdir(package_dir):
+            num_bytes += _dir_size(package_dir)
+        else:
+            num_bytes += os.path.getsize(package_dir)
+
+    # Record the size in the persistent cache
+    with _size_cache_lock:
+        _size_cache[cache_key] = {"size": num_bytes, "mtime": mtime}
+        with open(SIZE_CACHE_FILE, "wb") as file:
+            file.write(_dumps(_size_cache))
+
+    return num_bytes
+
+
+def _walk_deptree(packages):
+    """
+    Iterate over every package in a dependency tree.
+
+    Parameters
+    ----------
+    packages : list
+        A list of dictionaries representing python packages as returned by
+        `get_deptree`.
+
+    Yields
+    ------
+    dict
+        Each package in the tree, depth-first.
+    """
+    for package in packages:
+        yield package
+        yield from _walk_deptree(package.get("dependencies", ()))
+
+
+def _collect_package_sizes(packages, package_sizes):
+    """
+    Size every package in a dependency tree concurrently.
+
+    Sizing a package is I/O-bound stat work, so the unique packages in the
+    tree are sized in a thread pool rather than one at a time.
+
+    Parameters
+    ----------
+    packages : list
+        A list of dictionaries representing python packages as returned by
+        `get_deptree`.
+    package_sizes : dict
+        A dictionary mapping package keys to sizes. Packages already present
+        are skipped; newly collected sizes are added to it in place.
+    """
+    names = {
+        package["key"]: package["package_name"]
+        for package in _walk_deptree(packages)
+        if package["key"] not in package_sizes
+    }
+    if names:
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            package_sizes.update(
+                zip(names, executor.map(get_package_size, names.values()))
+            )
+
+
+def _annotate_packages(packages, size_cache, annotated, verbose=False):
+    """
+    Annotate every package in a dependency tree with its size.
+
+    The tree is traversed depth-first with an explicit stack rather than
+    recursion, so deep trees cost no extra stack frames.
+
+    Parameters
+    ----------
+    packages : list
+        A list of dictionaries representing python packages as returned by
+        `get_deptree`.
+    size_cache : dict
+        A dictionary mapping package keys to sizes. Missing packages are sized
+        on demand and added to it.
+    annotated : dict
+        A dictionary mapping package keys to their already-annotated subtrees.
+    verbose : bool, optional
+        If True, print each package and its size as it is annotated. Defaults
+        to False.
+    """
+    # Stack of (parent_list, index, depth); children are pushed in reverse so
+    # packages are visited in the same order recursion would visit them
+    stack = [(packages, ind, 0) for ind in reversed(range(len(packages)))]
+    while stack:
+        parent, ind, depth = stack.pop()
+        package = parent[ind]
+        key = package["key"]
+        already_annotated = key in annotated
+        if already_annotated:
+            # Swap in the previously annotated subtree so its dependencies
+            # don't need to be visited again
+            parent[ind] = package = annotated[key]
+        else:
+            if key not in size_cache:
+                size_cache[key] = get_package_size(package["package_name"])
+            package["size_bytes"] = size_cache[key]
+            package["size"] = format_size(size_cache[key])
+            annotated[key] = package
+
+        if verbose:
+            print_line = ""
+            if depth >= 1:
+                print_line = "|- "
+            if depth >= 2:
+                print_line = "   " * (depth - 2) + print_line
+            print_line += f"{package['key']}:\t{package['size']}"
+            print(print_line)
+
+        if not already_annotated:
+            dependencies = package.get("dependencies", [])
+            stack.extend(
+                (dependencies, child_ind, depth + 1)
+                for child_ind in reversed(range(len(dependencies)))
+            )
+
+
+def add_package_sizes(packages, *, size_cache=None, verbose=False):
     """
     Add package sizes to the given list of packages and their dependencies.
 
+    The same package often appears under many parents in a dependency tree.
+    The unique packages are first sized concurrently in a thread pool, and a
+    subtree that has already been annotated is reused in place of its
+    duplicates rather than being walked again.
+
     Parameters
     ----------
     packages : list
-        A list of dictionaries representing python packages as returned by pipdeptree.
-    _package_sizes : dict, optional
-        A dictionary containing the package sizes the sizes of packages that have
-        already been collected. Defaults to an empty dictionary.
-    _pkg_ind : int, optional
-        The index of the current package. Defaults to 0.
-    _cur_depth : int, optional
-        The current depth of the package in the dependency tree. Defaults to -1.
-    _is_root : bool, optional
-        Indicates whether the current package is the root package. Defaults to True.
+        A list of dictionaries representing python packages as returned by
+        `get_deptree`.
+    size_cache : dict, optional
+        A dictionary mapping package keys to sizes. Sizes already present are
+        reused; newly collected sizes are added to it in place. Defaults to
+        None, in which case a new dictionary is created.
+    verbose : bool, optional
+        If True, print each package and its size as it is annotated. Defaults
+        to False.
 
     Returns
     -------
-    package_sizes : dict
+    size_cache : dict
         A dictionary containing the package sizes.
-    _pkg_ind : int
-        The index of the last processed package.
     """
-    cur_depth = _cur_depth + 1
-    for package in packages:
-        if package["key"] not in _package_sizes:
-            package_size = get_package_size(package["package_name"])
-            _package_sizes[package["key"]] = package_size
-
-        package["size"] = _package_sizes[package["key"]]
-
-        print_line = ""
-        if cur_depth >= 1:
-            print_line = "|- "
-        if cur_depth >= 2:
-            print_line = "   " * (cur_depth - 2) + print_line
-        print_line += f"{package['key']}:\t{package['size']}"
-        print(print_line)
-
-        _pkg_ind += 1
-
-        if package.get("dependencies", None):
-            _package_sizes, _pkg_ind = add_package_sizes(
-                package["dependencies"],
-                _package_sizes=_package_sizes,
-                _pkg_ind=_pkg_ind,
-                _cur_depth=cur_depth,
-                _is_root=False,
-            )
+    if size_cache is None:
+        size_cache = {}
+
+    # Size all of the unique packages up front so the traversal below only
+    # has to annotate the tree
+    _collect_package_sizes(packages, size_cache)
+    _annotate_packages(packages, size_cache, {}, verbose=verbose)
+    return size_cache
+
+
+def _cached_deptree_file(cache_dir, package_name):
+    """
+    Get the path to a root package's file in the dependencies cache directory.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The path to the dependencies cache directory.
+    package_name : str
+        The name of the root package.
+
+    Returns
+    -------
+    str
+        The path to the package's cache file.
+    """
+    return os.path.join(cache_dir, f"{package_name}.json")
+
+
+def _load_cached_deptree(cache_dir, package_name):
+    """
+    Load a root package's dependency tree from the cache directory.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The path to the dependencies cache directory.
+    package_name : str
+        The name of the root package.
+
+    Returns
+    -------
+    list or None
+        The cached dependency tree, or None if the package is not cached or
+        the cached tree predates numeric sizes.
+    """
+    try:
+        with open(_cached_deptree_file(cache_dir, package_name), "rb") as file:
+            deptree = _loads(file.read())
+    except (FileNotFoundError, ValueError):
+        return None
+    # Trees cached by older versions lack numeric sizes; recollect them
+    if deptree and "size_bytes" not in deptree[0]:
+        return None
+    return deptree
+
+
+def _save_cached_deptree(cache_dir, package_name, deptree):
+    """
+    Save a root package's dependency tree to the cache directory.
+
+    The tree is written to a temporary file and moved into place with
+    `os.replace` so a concurrent reader never sees a partial file.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The path to the dependencies cache directory.
+    package_name : str
+        The name of the root package.
+    deptree : list
+        The dependency tree to save.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = _cached_deptree_file(cache_dir, package_name)
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, "wb") as file:
+        file.write(_dumps(deptree))
+    os.replace(tmp_file, cache_file)
+
+
+def _iter_legacy_cache(file):
+    """
+    Iterate over the entries of a legacy monolithic cache file.
+
+    When ijson is available the file is parsed lazily, materializing one
+    dependency tree at a time rather than the whole cache.
 
-    if _is_root:
-        return _package_sizes
+    Parameters
+    ----------
+    file : file object
+        The legacy cache file, opened in binary mode.
+
+    Yields
+    ------
+    tuple
+        ``(package_name, deptree)`` pairs for each cached root package.
+    """
+    if ijson is not None:
+        yield from ijson.kvitems(file, "")
     else:
-        return _package_sizes, _pkg_ind
+        yield from _loads(file.read()).items()
+
+
+def _migrate_legacy_cache(cache_dir):
+    """
+    Split a legacy monolithic cache file into per-package cache files.
+
+    Older versions cached every root package's tree in a single
+    `<cache_dir>.json` file. If one is found, each of its entries is written
+    out to its own file in `cache_dir` and the legacy file is removed.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The path to the dependencies cache directory.
+    """
+    legacy_file = f"{cache_dir}.json"
+    decode_errors = (ValueError,) if ijson is None else (ijson.JSONError,)
+    try:
+        with open(legacy_file, "rb") as file:
+            for package_name, deptree in _iter_legacy_cache(file):
+                if not os.path.exists(
+                    _cached_deptree_file(cache_dir, package_name)
+                ):
+                    _save_cached_deptree(cache_dir, package_name, deptree)
+    except FileNotFoundError:
+        return
+    except decode_errors:
+        return
+    os.remove(legacy_file)
 
 
 def get_deptree_with_sizes(
-    package_name, cache_file=None, refresh=False, no_cache=False
+    package_name, cache_dir=None, refresh=False, no_cache=False
 ):
     """
     Get the dependency tree for a given package with package sizes.
@@ -223,83 +625,72 @@ def get_deptree_with_sizes(
     package_name : str
         The name of the package.
 
-    cache_file : str, optional
-        The file path to the dependencies cache file. If provided, the function will try
-        to load the dependency tree from this file. If the file is not found, the
-        function will collect the dependency tree and save it to this file.
+    cache_dir : str, optional
+        The path to the dependencies cache directory. If provided, the function
+        will try to load the dependency tree from `<cache_dir>/<package>.json`.
+        If the file is not found, the function will collect the dependency tree
+        and save it there.
 
     refresh : bool, optional
         If True, the function will always collect the dependency tree, even if it exists
-        in the cache file. Defaults to False.
+        in the cache directory. Defaults to False.
 
     no_cache : bool, optional
-        If True, the function will not use the cache file and will always collect the
-        dependency tree. Defaults to False.
+        If True, the function will not use the cache directory and will always collect
+        the dependency tree. Defaults to False.
 
     Returns
     -------
-    dict
+    list
         The dependency tree in JSON format with package sizes.
 
-    Raises
-    ------
-    FileNotFoundError
-        If the provided `cache_file` is not found.
-
     Notes
     -----
     This function retrieves the dependency tree for a given package and adds package
     sizes to each node in the tree. The package sizes are calculated based on the size
     of the package files.
 
-    If `cache_file` is provided, the function will try to load the dependency tree
-    from this file. If the file is not found or `no_cache` is True, the function will
-    collect the dependency tree and save it to this file.
+    Each root package is cached in its own file, so an invocation only reads
+    and writes the one tree it needs rather than round-tripping every cached
+    tree. A legacy monolithic `<cache_dir>.json` file from older versions is
+    split into per-package files on first use.
 
     If `refresh` is True, the function will always collect the dependency tree, even if
-    it exists in the cache file and update it in the cache file.
+    it exists in the cache directory, and update it there.
 
     Example
     -------
-    >>> get_deptree_with_sizes('numpy', 'deps_cache.json', refresh=True)
-    {'name': 'numpy', 'size': 1024, 'dependencies': [{'name': 'scipy', 'size': 512,
-    'dependencies': []}]}
+    >>> get_deptree_with_sizes('numpy', 'deps_cache', refresh=True)  # doctest: +SKIP
+    [{'key': 'numpy', 'size_bytes': 71404764, 'size': '68MB', 'dependencies': []}]
     """
-    if cache_file and not no_cache:
+    # One size cache per invocation, shared by every sizing pass
+    size_cache = {}
+
+    if cache_dir and not no_cache:
+        # Ingest any cache file left behind by older versions
+        _migrate_legacy_cache(cache_dir)
+
         deptree = None
 
-        # Load the dependency tree from the cache file unless we want to refresh it
+        # Load the dependency tree from the cache unless we want to refresh it
         if not refresh:
-            try:
-                with open(cache_file, "r") as file:
-                    deptree = json.load(file)[package_name]
-            except (FileNotFoundError, KeyError):
-                pass
+            deptree = _load_cached_deptree(cache_dir, package_name)
 
         # Collect the dependency tree if it was not found in the cache or we want to
-        # refresh it
+        # refresh it, and save it back to the cache
         if not deptree:
             # Collect the dependency tree
             deptree = get_deptree(package_name)
             # Call the function with the loaded dependencies
-            add_package_sizes(deptree)
-
-        # Save the dependency tree to the cache file
-        # Each package's dependencies are stored under a new key in the cache file
-        try:
-            with open(cache_file, "r") as file:
-                cache_deptree = json.load(file)
-        except FileNotFoundError:
-            cache_deptree = {}
-        cache_deptree[package_name] = deptree
-        with open(cache_file, "w") as file:
-            json.dump(cache_deptree, file, indent=2)
-
-    # If no cache file is provided or we want to ignore the cache
+            add_package_sizes(deptree, size_cache=size_cache)
+            # Save the dependency tree to its own file in the cache directory
+            _save_cached_deptree(cache_dir, package_name, deptree)
+
+    # If no cache directory is provided or we want to ignore the cache
     else:
         # Collect the dependency tree
         deptree = get_deptree(package_name)
         # Call the function with the loaded dependencies
-        add_package_sizes(deptree)
+        add_package_sizes(deptree, size_cache=size_cache)
 
     return deptree
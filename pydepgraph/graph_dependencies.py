@@ -2,11 +2,46 @@
 This module contains functions for creating and visualizing dependency graphs.
 """
 
-import math
+import bisect
+import hashlib
 import json
+import math
+import os
 import networkx as nx
 import matplotlib.pyplot as plt
 
+# Size thresholds in bytes and the color for each resulting bucket. The last
+# color covers everything at or above the final threshold.
+SIZE_THRESHOLDS = [
+    10 * 1024,
+    100 * 1024,
+    1024 * 1024,
+    10 * 1024 * 1024,
+    100 * 1024 * 1024,
+]
+SIZE_COLORS = [
+    "azure",
+    "lightcyan",
+    "paleturquoise",
+    "yellow",
+    "orange",
+    "hotpink",
+]
+
+# Figure sizing: base size in inches for small graphs, how quickly the figure
+# grows with the number of nodes, and the maximum size it is clamped to
+FIGSIZE_BASE = (2, 1)
+FIGSIZE_SCALING_FACTOR = 0.4
+FIGSIZE_MAX = (100, 40)
+
+# Below this many nodes, a simple by-depth layout is used instead of spawning
+# a Graphviz process
+GRAPHVIZ_LAYOUT_MIN_NODES = 50
+
+# Graphviz layouts are cached here, keyed by a hash of the graph's edges, so
+# re-rendering an unchanged tree skips the layout step
+LAYOUT_CACHE_DIR = "layout_cache"
+
 
 def get_color(package):
     """
@@ -15,92 +50,83 @@ def get_color(package):
     Parameters
     ----------
     package : dict
-        The package information.
+        The package information, including its size in bytes under the
+        "size_bytes" key.
 
     Returns
     -------
     str
-        The color corresponding to the package size.
-
-    Notes
-    -----
-    The color is determined based on the size of the package. If the size is in KB,
-    the color is determined as follows:
-        - If the size is less than 10 KB, the color is "azure".
-        - If the size is between 10 KB and 100 KB, the color is "lightcyan".
-        - If the size is greater than or equal to 100 KB, the color is "paleturquoise".
-
-    If the size is in MB, the color is determined as follows:
-        - If the size is less than 10 MB, the color is "yellow".
-        - If the size is between 10 MB and 100 MB, the color is "orange".
-        - If the size is greater than or equal to 100 MB, the color is "hotpink".
+        The color corresponding to the package size, found by bisecting
+        `SIZE_THRESHOLDS` and indexing into `SIZE_COLORS`. Packages color from
+        "azure" (under 10 KB) through "hotpink" (100 MB and up).
     """
-    num, order = package["size"][0:-2], package["size"][-2:]
-    num = int(num)
-    if order == "KB":
-        if num < 10:
-            return "azure"
-        if num < 100:
-            return "lightcyan"
-        else:
-            return "paleturquoise"
-    if order == "MB":
-        if num < 10:
-            return "yellow"
-        if num < 100:
-            return "orange"
-        else:
-            return "hotpink"
-
-
-def create_graph(dependencies, graph=None, parent_name=None, depth=-1):
+    return SIZE_COLORS[bisect.bisect_left(SIZE_THRESHOLDS, package["size_bytes"])]
+
+
+def create_graph(dependencies, graph=None, verbose=False):
     """
     Create a graph representation of package dependencies.
 
+    The tree is traversed depth-first with an explicit stack rather than
+    recursion, so deep trees cost no extra stack frames. Node colors and
+    labels are collected while the graph is built, so drawing doesn't need to
+    walk the nodes again to gather them.
+
     Parameters
     ----------
     dependencies : list
         A list of dictionaries representing package dependencies.
-    graph : nx.Graph, optional
+    graph : nx.DiGraph, optional
         The graph object to add nodes and edges to. If not provided, a new graph will be created.
-    parent_name : str, optional
-        The name of the parent package. Used to create unique node names.
-    depth : int, optional
-        The depth of the current recursion. Used for indentation in print statements.
+    verbose : bool, optional
+        If True, print each package as it is added to the graph. Defaults to
+        False.
 
     Returns
     -------
-    graph : nx.Graph
-        The graph object with nodes and edges representing the package dependencies.
+    graph : nx.DiGraph
+        The graph object with nodes and edges representing the package
+        dependencies, with edges pointing from each package to its
+        dependencies.
+    colors : list
+        The node colors, in node insertion order.
+    labels : dict
+        The node labels, keyed by node name.
     """
     if graph is None:
-        graph = nx.Graph()
-
-    cur_depth = depth + 1
-
-    for package in dependencies:
-        print("| " * cur_depth + package["key"])
+        graph = nx.DiGraph()
+    colors = []
+    labels = {}
+
+    # Bind the methods called once per node to locals; attribute lookups add
+    # up over thousands of iterations
+    add_node = graph.add_node
+    add_edge = graph.add_edge
+    append_color = colors.append
+    _get_color = get_color
+
+    # Stack of (package, parent_name, depth); children are pushed in reverse
+    # so packages are visited in the same order recursion would visit them
+    stack = [(package, "", 0) for package in reversed(dependencies)]
+    while stack:
+        package, parent_name, depth = stack.pop()
+        if verbose:
+            print("| " * depth + package["key"])
 
-        if not parent_name:
-            parent_name = ""
         name = f"{parent_name}-{package['key']}"
-        graph.add_node(
-            name,
-            label=f"{package['key']}\n{package['size']}",
-            size=package["size"],
-            color=get_color(package),
-        )
+        label = f"{package['key']}\n{package['size']}"
+        color = _get_color(package)
+        add_node(name, label=label, size=package["size"], color=color, depth=depth)
+        append_color(color)
+        labels[name] = label
         if parent_name:
-            graph.add_edge(parent_name, name)
+            add_edge(parent_name, name)
 
-        if "dependencies" in package:
-            graph = create_graph(
-                package["dependencies"],
-                graph=graph,
-                parent_name=name,
-                depth=cur_depth,
-            )
-    return graph
+        stack.extend(
+            (child, name, depth + 1)
+            for child in reversed(package.get("dependencies", ()))
+        )
+    return graph, colors, labels
 
 
 def calculate_figure_size(graph):
@@ -120,9 +146,10 @@ def calculate_figure_size(graph):
     Notes
     -----
     The figure size is calculated based on the number of nodes in the graph.
-    The base width and height are set to 2 and 1, respectively, for small graphs.
-    The size is increased based on the number of nodes using a scaling factor of 0.1.
-    The maximum size is capped at 100 for width and 40 for height.
+    The base width and height are `FIGSIZE_BASE`, for small graphs. The width
+    grows with the number of nodes and the height with its square root, both
+    scaled by `FIGSIZE_SCALING_FACTOR`, and the result is clamped to
+    `FIGSIZE_MAX`.
 
     Examples
     --------
@@ -130,17 +157,75 @@ def calculate_figure_size(graph):
     >>> graph = nx.Graph()
     >>> graph.add_nodes_from([1, 2, 3, 4, 5])
     >>> calculate_figure_size(graph)
-    (8.5, 6.6)
+    (4.0, 1.894427190999916)
     """
-    num_nodes = len(graph.nodes())
-    base_width, base_height = 2, 1  # Base size for small graphs
-    scaling_factor = 0.4  # Increase size based on the number of nodes
+    num_nodes = graph.number_of_nodes()
+    base_width, base_height = FIGSIZE_BASE
+    max_width, max_height = FIGSIZE_MAX
+
+    # Cap the size to not exceed the maximum
+    width = min(max_width, base_width + FIGSIZE_SCALING_FACTOR * num_nodes)
+    height = min(
+        max_height, base_height + FIGSIZE_SCALING_FACTOR * math.sqrt(num_nodes)
+    )
 
-    # Cap the size to not exceed a maximum
-    extra_width = min(100, base_width + scaling_factor * num_nodes)
-    extra_height = min(40, base_height + scaling_factor * math.sqrt(num_nodes))
+    return (width, height)
 
-    return (extra_width, extra_height)
+
+def _layout_signature(graph):
+    """
+    Hash a graph's structure for use as a layout cache key.
+
+    Parameters
+    ----------
+    graph : NetworkX graph
+        The graph to hash.
+
+    Returns
+    -------
+    str
+        A hex digest of the graph's sorted edge list. Two graphs with the
+        same nodes and edges produce the same signature.
+    """
+    return hashlib.blake2b(
+        repr(sorted(graph.edges())).encode(), digest_size=16
+    ).hexdigest()
+
+
+def _graphviz_layout(graph):
+    """
+    Compute the Graphviz dot layout for a graph, caching the result on disk.
+
+    The layout only depends on the graph's structure, so it is cached in
+    `LAYOUT_CACHE_DIR` keyed by a hash of the edge list. Re-rendering the same
+    tree (e.g. after refreshing only sizes) reuses the cached positions
+    instead of running Graphviz again.
+
+    Parameters
+    ----------
+    graph : NetworkX graph
+        The graph to lay out.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping node names to positions.
+    """
+    cache_file = os.path.join(LAYOUT_CACHE_DIR, f"{_layout_signature(graph)}.json")
+    try:
+        with open(cache_file, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    pos = nx.drawing.nx_agraph.graphviz_layout(graph, prog="dot", root=0)
+
+    os.makedirs(LAYOUT_CACHE_DIR, exist_ok=True)
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, "w") as file:
+        json.dump({name: list(xy) for name, xy in pos.items()}, file)
+    os.replace(tmp_file, cache_file)
+    return pos
 
 
 def draw_graph(deptree, save_path="deptree.png", figsize=None):
@@ -158,10 +243,14 @@ def draw_graph(deptree, save_path="deptree.png", figsize=None):
         be calculated based on the number of nodes in the graph (default is None).
     """
     print("Creating graph")
-    graph = create_graph(deptree)
+    graph, colors, labels = create_graph(deptree)
 
     print("Performing layout")
-    pos = nx.drawing.nx_agraph.graphviz_layout(graph, prog="dot", root=0)
+    if graph.number_of_nodes() < GRAPHVIZ_LAYOUT_MIN_NODES:
+        # Small trees don't need Graphviz; arrange each depth in its own row
+        pos = nx.multipartite_layout(graph, subset_key="depth", align="horizontal")
+    else:
+        pos = _graphviz_layout(graph)
 
     print("Rescaling layout")
     pos = nx.rescale_layout_dict(pos, scale=3)
@@ -171,14 +260,15 @@ def draw_graph(deptree, save_path="deptree.png", figsize=None):
     plt.figure(figsize=figsize)
 
     print("Drawing nodes")
-    colors = [color for color in nx.get_node_attributes(graph, "color").values()]
-    nx.draw_networkx_nodes(graph, pos, node_shape="s", node_color=colors, node_size=500)
+    nodes = list(graph)
+    nx.draw_networkx_nodes(
+        graph, pos, nodelist=nodes, node_shape="s", node_color=colors, node_size=500
+    )
 
     print("Drawing edges")
     nx.draw_networkx_edges(graph, pos)
 
     print("Drawing labels")
-    labels = nx.get_node_attributes(graph, "label")
     nx.draw_networkx_labels(graph, pos, labels=labels, font_size=8)
 
     print("Saving")
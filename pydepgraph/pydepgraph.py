@@ -13,7 +13,7 @@ from pydepgraph.graph_dependencies import draw_graph
 def pydepgraph(
     package,
     output_file,
-    cache_file=None,
+    cache_dir=None,
     figsize=None,
     refresh=False,
     no_cache=False,
@@ -27,19 +27,19 @@ def pydepgraph(
         The name of the package to create the dependency graph for.
     output_file : str
         The name of the file to save the dependency graph to.
-    cache_file : str, optional
-        The name of the file to cache the dependencies to. Defaults to None.
+    cache_dir : str, optional
+        The path to the directory to cache dependencies in. Defaults to None.
     figsize : tuple of int, optional
         Explicitly set the dimensions (width and height) of the graph in inches.
         If not provided, a reasonable figsize will be calculated based on the number of
         nodes in the graph.
     refresh : bool, optional
-        Recompute the package's dependencies and replace in the cache file.
+        Recompute the package's dependencies and replace in the cache directory.
     no_cache : bool, optional
-        Do not use the cache file for dependencies.
+        Do not use the cache directory for dependencies.
     """
     deptree = get_deptree_with_sizes(
-        package, cache_file=cache_file, refresh=refresh, no_cache=no_cache
+        package, cache_dir=cache_dir, refresh=refresh, no_cache=no_cache
     )
     draw_graph(deptree, output_file, figsize=figsize)
 
@@ -61,24 +61,25 @@ def main():
     )
     parser.add_argument(
         "-c",
-        "--cache-file",
+        "--cache-dir",
         type=str,
-        default="deps_cache.json",
+        default="deps_cache",
         help=(
-            "The name of the file to cache the dependencies to. "
-            "All previous dependency trees will be cached to this file and reused when "
-            "the same package is requested again. Defaults to 'deps_cache.json'."
+            "The path to the directory to cache dependencies in. "
+            "Each package's dependency tree is cached to its own file in this "
+            "directory and reused when the same package is requested again. "
+            "Defaults to 'deps_cache'."
         ),
     )
     parser.add_argument(
         "--refresh",
         action="store_true",
-        help="Recompute the package's dependencies and replace in the cache file.",
+        help="Recompute the package's dependencies and replace in the cache directory.",
     )
     parser.add_argument(
         "--no-cache",
         action="store_true",
-        help="Do not use the cache file for dependencies.",
+        help="Do not use the cache directory for dependencies.",
     )
     parser.add_argument(
         "-f",